@@ -135,120 +135,175 @@ patterns_to_delete:
 
 from ansible.module_utils.basic import AnsibleModule
 import os
-import re
+import subprocess
 
 ZYPPER_CMD = "/usr/bin/zypper"
-PACKAGE_RE = re.compile("^\d+\ +\| ([^\|\ ]*)")
 
-def zypper_lock(module, command, patterns=None):
+# Checked once per process so repeated task invocations skip the syscalls.
+_ZYPPER_OK = os.path.isfile(ZYPPER_CMD) and os.access(ZYPPER_CMD, os.X_OK)
+
+_ADDLOCK = ("addlock",)
+_REMOVELOCK = ("removelock",)
+_LOCK_CMDS = frozenset(("addlock", "removelock"))
+_ADDLOCK_ONLY = frozenset(("addlock",))
+_PKGTYPES = frozenset(("package", "patch", "pattern", "product", "srcpackage"))
+
+# Built once at import so repeated main() calls skip the dict-of-dicts setup.
+_ARG_SPEC = dict(
+    name = dict(type="list", elements="str", default=[]),
+    state = dict(type="str", default="present", choices=("present", "absent", "list", "purge")),
+    pkgtype = dict(type="str", choices=("package", "patch", "pattern", "product", "srcpackage")),
+    repo = dict(type="str"),
+    message = dict(type="str")
+)
+
+def zypper_run(module, command, patterns):
+    # A lock command with no patterns is a no-op, so do not spawn zypper.
+    if not patterns:
+        return ""
+
+    full_command_arr = [ZYPPER_CMD, "--quiet"] + command + patterns
+    rc, out, err = module.run_command( full_command_arr, check_rc=True )
+    return out
+
+def zypper_list_locks(module):
     output = []
 
-    if patterns is not None:
-        full_command_arr = [ZYPPER_CMD, "--quiet"] + command + patterns
-        rc, out, err = module.run_command( full_command_arr, check_rc=True )
-        output.append(out)
-    else:
-        full_command_arr = [ZYPPER_CMD] + command
-        rc, out, err = module.run_command( full_command_arr, check_rc=True )
-        for line in out.split("\n"):
-            package = PACKAGE_RE.match(line)
-            if package is not None:
-                output.append(package[1])
-
-    result = "\n".join(output)
-    return result
+    # The locks read is a pure stdout fetch with nothing secret in it, so
+    # call zypper directly and skip run_command's escaping and logging
+    # layers; close_fds=False also avoids the fd-table scan before exec.
+    # Fall back to run_command so Ansible still reports genuine failures.
+    try:
+        out = subprocess.run( [ZYPPER_CMD, "locks"], capture_output=True,
+                              text=True, check=True, close_fds=False ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        rc, out, err = module.run_command( [ZYPPER_CMD, "locks"], check_rc=True )
+    for line in out.splitlines():
+        # Lock table rows look like "<num> | <name> | ...", so a plain
+        # split is much cheaper than running a regex over every line.
+        parts = line.split('|', 2)
+        if len(parts) >= 2 and parts[0].strip().isdigit():
+            name = parts[1].strip()
+            # Never let an empty name into the locklist: purge turns
+            # len(locklist) into removelock indexes, so a phantom entry
+            # would pass an out-of-range index to zypper.
+            if name:
+                output.append(name)
+
+    return output
 
 def process_options(options, command):
-    result = command
+    # Copy so callers can share a constant base command between calls.
+    result = list(command)
 
-    if command[0] in ["addlock","removelock"]:
-        if options["pkgtype"] in ["package","patch","pattern","product","srcpackage"]:
-            result.append("-t")
-            result.append(options['pkgtype'])
+    if command[0] in _LOCK_CMDS:
+        if options["pkgtype"] in _PKGTYPES:
+            result.extend(("-t", options['pkgtype']))
         if options["repo"] is not None:
-            result.append("-r")
-            result.append(options['repo'])
-    if command[0] in ["addlock"]:
+            result.extend(("-r", options['repo']))
+    if command[0] in _ADDLOCK_ONLY:
         if options["message"] is not None:
-            result.append("-m")
-            result.append(options['message'])
+            result.extend(("-m", options['message']))
 
     return result
 
-def main():
-    # Check that the required files exist.
-    if not os.path.isfile(ZYPPER_CMD) and os.access(ZYPPER_CMD, os.X_OK):
-        module.fail_json(f"Cannot find {ZYPPER_CMD}")
+def _handle_present(module, patterns, initial_locklist, initial_lockset, options):
+    msg = ""
+
+    patterns_to_add = [p for p in patterns if p not in initial_lockset]
+    changed = bool(patterns_to_add)
+
+    if patterns_to_add and not module.check_mode:
+        zypper_command = process_options(options, _ADDLOCK)
+        msg = zypper_run(module, zypper_command, patterns_to_add)
+
+    if module.check_mode:
+        final_locklist = initial_locklist
+    else:
+        final_locklist = initial_locklist + patterns_to_add
+
+    return changed, msg, patterns_to_add, [], final_locklist
 
+def _handle_absent(module, patterns, initial_locklist, initial_lockset, options):
+    msg = ""
+
+    patterns_to_delete = [p for p in patterns if p in initial_lockset]
+    changed = bool(patterns_to_delete)
+
+    if patterns_to_delete and not module.check_mode:
+        zypper_command = process_options(options, _REMOVELOCK)
+        msg = zypper_run(module, zypper_command, patterns_to_delete)
+
+    if module.check_mode:
+        final_locklist = initial_locklist
+    else:
+        delete_set = set(patterns_to_delete)
+        final_locklist = [p for p in initial_locklist if p not in delete_set]
+
+    return changed, msg, [], patterns_to_delete, final_locklist
+
+def _handle_purge(module, patterns, initial_locklist, initial_lockset, options):
+    changed = False
+    msg = ""
+
+    patterns_to_delete = initial_locklist
+    if patterns_to_delete and not module.check_mode:
+        zypper_command = process_options(options, _REMOVELOCK)
+        # Instead of having to keep track of which repo each pattern is in, just remove all indexes from last to first.
+        indexes_to_delete = list(map(str, range(len(patterns_to_delete), 0, -1)))
+        msg = zypper_run(module, zypper_command, indexes_to_delete)
+        changed = True
+
+    final_locklist = initial_locklist if module.check_mode else []
+
+    return changed, msg, [], patterns_to_delete, final_locklist
+
+# The "list" state exits early in main() and never reaches the dispatch.
+_HANDLERS = {
+    "present": _handle_present,
+    "absent": _handle_absent,
+    "purge": _handle_purge
+}
+
+def main():
     # Create the Ansible Module.
     module = AnsibleModule(
-        argument_spec = dict(
-            name = dict(type="list", elements="str", default=[]),
-            state = dict(type="str", default="present", choices=["present", "absent", "list", "purge"]),
-            pkgtype = dict(type="str", choices=["package", "patch", "pattern", "product", "srcpackage"]),
-            repo = dict(type="str"),
-            message = dict(type="str")
-        ),
+        argument_spec = _ARG_SPEC,
         supports_check_mode=True
     )
 
-    # Set up some variables.
-    patterns = module.params["name"]
+    # Check that the zypper binary exists and is executable.
+    if not _ZYPPER_OK:
+        module.fail_json(msg=f"Cannot find or execute {ZYPPER_CMD}")
+
+    # Set up some variables. Dedupe the requested names (keeping order) so
+    # repeated entries are not diffed or passed to zypper twice.
+    patterns = list(dict.fromkeys(module.params["name"]))
     state = module.params["state"]
+
+    # Get the list of packages which are currently locked.
+    initial_locklist = zypper_list_locks(module)
+    initial_lockset = set(initial_locklist)
+
+    # The list state is a read-only query, so report the locklist and exit
+    # before doing any of the add/remove bookkeeping.
+    if state == "list":
+        module.exit_json(changed=False, msg="", initial_locklist=initial_locklist,
+                         final_locklist=initial_locklist, patterns_to_add=[],
+                         patterns_to_delete=[])
+
     options = dict(
         pkgtype=module.params["pkgtype"],
         repo=module.params["repo"],
         message=module.params["message"]
     )
 
-    changed = False
-    msg = ""
-
-    # Get the list of packages which are currently locked.
-    initial_locklist = zypper_lock(module, ["locks"]).split("\n")
-
-    # Add or remove packages, but only if necessary.
-    patterns_to_add = []
-    patterns_to_delete = []
-
-    if state in ["present"]:
-        for p in patterns:
-            if p not in initial_locklist:
-                patterns_to_add.append(p)
-                if module.check_mode:
-                    changed = True
-
-        if patterns_to_add and not module.check_mode:
-            zypper_command = process_options(options, ["addlock"])
-            msg = zypper_lock(module, zypper_command, patterns_to_add)
-            changed = True
-
-    elif state in ["absent"]:
-        for p in patterns:
-            if p in initial_locklist:
-                patterns_to_delete.append(p)
-                if module.check_mode:
-                    changed = True
-
-        if patterns_to_delete and not module.check_mode:
-            zypper_command = process_options(options, ["removelock"])
-            msg = zypper_lock(module, zypper_command, patterns_to_delete)
-            changed = True
-
-    elif state in ["purge"]:
-        patterns_to_delete = initial_locklist
-        if patterns_to_delete and not module.check_mode:
-            zypper_command = process_options(options, ["removelock"])
-            # Instead of having to keep track of which repo each pattern is in, just remove all indexes from last to first.
-            indexes_to_delete = [f'{x}' for x in reversed(range(1, len(patterns_to_delete)+1))]
-            msg = zypper_lock(module, zypper_command, indexes_to_delete)
-            changed = True
-
-    # Get a list of changes.
-    if module.check_mode or state in ["list"]:
-        final_locklist = initial_locklist
-    else:
-        final_locklist = zypper_lock(module, ["locks"]).split("\n")
+    # Add or remove packages, but only if necessary. Each handler applies
+    # the in-memory delta to get the final locklist rather than paying for
+    # a second "zypper locks" subprocess.
+    handler = _HANDLERS[state]
+    changed, msg, patterns_to_add, patterns_to_delete, final_locklist = handler(
+        module, patterns, initial_locklist, initial_lockset, options)
 
     # Output a result.
     response = {